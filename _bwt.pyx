@@ -0,0 +1,49 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+# Rotation-order fallback for bwt_transform when pydivsufsort is not
+# installed: qsort over the rotation start indices, each comparison a
+# memcmp of n bytes into a doubled copy of the input.
+
+import numpy as np
+
+from libc.stdlib cimport free, malloc, qsort
+from libc.string cimport memcmp, memcpy
+
+cdef const unsigned char *_cmp_buf
+cdef Py_ssize_t _cmp_n
+
+cdef int _rot_cmp(const void *a, const void *b) noexcept nogil:
+    cdef Py_ssize_t i = (<const Py_ssize_t *> a)[0]
+    cdef Py_ssize_t j = (<const Py_ssize_t *> b)[0]
+    cdef int r = memcmp(_cmp_buf + i, _cmp_buf + j, _cmp_n)
+    if r != 0:
+        return r
+    # identical rotations: order by index so the sort is deterministic
+    return (i > j) - (i < j)
+
+def bwt_rotation_order(const unsigned char[::1] data):
+    """Return the cyclic-rotation sort order of ``data`` as int64."""
+    cdef Py_ssize_t n = data.shape[0]
+    out = np.empty(n, dtype=np.int64)
+    if n == 0:
+        return out
+    cdef long long[::1] ov = out
+    cdef unsigned char *dbl = <unsigned char *> malloc(2 * n)
+    cdef Py_ssize_t *idx = <Py_ssize_t *> malloc(n * sizeof(Py_ssize_t))
+    if dbl == NULL or idx == NULL:
+        free(dbl)
+        free(idx)
+        raise MemoryError()
+    memcpy(dbl, &data[0], n)
+    memcpy(dbl + n, &data[0], n)
+    cdef Py_ssize_t i
+    for i in range(n):
+        idx[i] = i
+    global _cmp_buf, _cmp_n
+    _cmp_buf = dbl
+    _cmp_n   = n
+    qsort(idx, n, sizeof(Py_ssize_t), _rot_cmp)
+    for i in range(n):
+        ov[i] = idx[i]
+    free(dbl)
+    free(idx)
+    return out
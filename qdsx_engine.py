@@ -2,20 +2,54 @@
 # QDSX Engine — single-file, Android-safe compressor
 
 import os, sys, json, struct, time, hashlib, random
-import zlib, bz2, lzma
+import zlib, bz2, lzma, mmap, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
+import numpy as np
+
+try:
+    from pydivsufsort import divsufsort
+except ImportError:
+    divsufsort = None
+
+try:
+    from _bwt import bwt_rotation_order as _bwt_rotation_order_c
+except ImportError:
+    _bwt_rotation_order_c = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
 LOG_DIR = Path("./QDSX_logs")
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
 MAGIC   = b"QDSX"
-VERSION = 2
+VERSION = 3
+
+TRANSFORM_IDS = {"none": 0, "delta": 1, "rle": 2, "bwt_mtf_rle": 3}
+CODEC_IDS     = {"none": 0, "zlib": 1, "bz2": 2, "lzma": 3, "zstd": 4}
+_TRANSFORM_BY_ID = {v: k for k, v in TRANSFORM_IDS.items()}
+_CODEC_BY_ID     = {v: k for k, v in CODEC_IDS.items()}
+
+# magic, version, transform id, codec id, orig_size, sha256, epoch, name len
+_HDR_FMT  = ">4sIBBQ32sQH"
+_HDR_SIZE = struct.calcsize(_HDR_FMT)
 
 def sha256_bytes(b: bytes) -> str:
     h = hashlib.sha256()
     h.update(b)
     return h.hexdigest()
 
+_EMPTY_SHA256 = sha256_bytes(b"")
+
 def log(msg: str) -> None:
     ts = time.strftime("%Y-%m-%d %H:%M:%S")
     with open(LOG_DIR / "qdsx.log", "a", encoding="utf-8") as f:
@@ -26,128 +60,333 @@ def log(msg: str) -> None:
 def tf_none(data: bytes) -> bytes:  return data
 def itf_none(data: bytes) -> bytes: return data
 
+# Each stage has a _np core working uint8-array-to-uint8-array; the
+# public tf_*/itf_* wrappers convert at the bytes boundary only, so
+# chained stages (the BWT pipeline below) never round-trip through
+# intermediate bytes objects.
+
+def _tf_delta_np(a):
+    out = a.copy()
+    # uint8 subtraction wraps mod 256, matching the old (b - prev) & 0xFF
+    np.subtract(a[1:], a[:-1], out=out[1:])
+    return out
+
+def _itf_delta_np(a):
+    return np.cumsum(a, dtype=np.uint8)
+
 def tf_delta(data: bytes) -> bytes:
-    out  = bytearray()
-    prev = 0
-    for b in data:
-        out.append((b - prev) & 0xFF)
-        prev = b
-    return bytes(out)
+    a = np.frombuffer(data, dtype=np.uint8)
+    if a.size == 0:
+        return b""
+    return _tf_delta_np(a).tobytes()
 
 def itf_delta(data: bytes) -> bytes:
-    out  = bytearray()
-    prev = 0
-    for b in data:
-        val = (b + prev) & 0xFF
-        out.append(val)
-        prev = val
-    return bytes(out)
+    return _itf_delta_np(np.frombuffer(data, dtype=np.uint8)).tobytes()
+
+def _tf_rle_np(a):
+    change = np.concatenate(([0], np.flatnonzero(a[1:] != a[:-1]) + 1, [a.size]))
+    vals   = a[change[:-1]]
+    lens   = np.diff(change)
+    # split runs longer than 255 into (255, 255, ..., remainder) pairs
+    reps     = (lens + 254) // 255
+    out_vals = np.repeat(vals, reps)
+    out_lens = np.full(out_vals.size, 255, dtype=np.uint8)
+    out_lens[np.cumsum(reps) - 1] = (lens - 255 * (reps - 1)).astype(np.uint8)
+    out = np.empty(2 * out_vals.size, dtype=np.uint8)
+    out[0::2] = out_vals
+    out[1::2] = out_lens
+    return out
+
+def _itf_rle_np(a):
+    a = a[:(a.size // 2) * 2]
+    return np.repeat(a[0::2], a[1::2])
 
 def tf_rle(data: bytes) -> bytes:
-    out = bytearray()
-    i   = 0
-    n   = len(data)
-    while i < n:
-        b   = data[i]
-        run = 1
-        i  += 1
-        while i < n and data[i] == b and run < 255:
-            run += 1
-            i   += 1
-        out.append(b)
-        out.append(run)
-    return bytes(out)
+    a = np.frombuffer(data, dtype=np.uint8)
+    if a.size == 0:
+        return b""
+    return _tf_rle_np(a).tobytes()
 
 def itf_rle(data: bytes) -> bytes:
-    out = bytearray()
-    it  = iter(data)
-    for b, run in zip(it, it):
-        out.extend([b] * run)
-    return bytes(out)
+    return _itf_rle_np(np.frombuffer(data, dtype=np.uint8)).tobytes()
 
 # ------------- BWT + MTF + RLE ----------------
 
-def bwt_transform(data: bytes):
+def _bwt_rotation_order_py(data):
+    # Manber-Myers prefix doubling over the cyclic rotations: each sort
+    # pass keys on two small rank ints per position, never an n-byte
+    # slice, so memory stays O(n) where sorted(key=rotation) held O(n^2)
+    # worth of keys. Last-resort path when neither SA backend is around.
+    n    = len(data)
+    sa   = list(range(n))
+    rank = list(data)
+    k    = 1
+    while True:
+        def key(i):
+            return (rank[i], rank[(i + k) % n])
+        sa.sort(key=key)
+        new = [0] * n
+        for t in range(1, n):
+            new[sa[t]] = new[sa[t - 1]] + (key(sa[t]) != key(sa[t - 1]))
+        rank = new
+        # fully periodic inputs never break their ties; any order among
+        # identical rotations yields the same BWT, so stop at k >= n
+        if rank[sa[-1]] == n - 1 or k >= n:
+            break
+        k <<= 1
+    return np.array(sa, dtype=np.int64)
+
+def _bwt_last_np(data):
+    # Suffix array over the doubled input: suffixes starting in [0, n)
+    # compare byte-for-byte like the cyclic rotations do, so filtering
+    # them out of the SA gives the rotation order without ever
+    # materializing an n-byte key per rotation.
     n = len(data)
-    if n == 0:
+    if divsufsort is not None:
+        sa = divsufsort(bytes(data) + bytes(data))
+        order = sa[sa < n]
+    elif _bwt_rotation_order_c is not None:
+        order = _bwt_rotation_order_c(data)
+    else:
+        order = _bwt_rotation_order_py(data)
+    arr     = np.frombuffer(data, dtype=np.uint8)
+    idx     = (order.astype(np.int64) - 1) % n
+    primary = int(np.flatnonzero(order == 0)[0])
+    return arr[idx], primary
+
+def bwt_transform(data: bytes):
+    if len(data) == 0:
         return b"", 0
-    rotations = range(n)
-    def rot_key(i):
-        return data[i:] + data[:i]
-    order   = sorted(rotations, key=rot_key)
-    primary = order.index(0)
-    last_col = bytearray(n)
-    for r, i in enumerate(order):
-        last_col[r] = data[i - 1] if i != 0 else data[-1]
-    return bytes(last_col), primary
+    last_col, primary = _bwt_last_np(data)
+    return last_col.tobytes(), primary
 
-def bwt_inverse(last_col: bytes, primary: int) -> bytes:
-    n = len(last_col)
+def _bwt_inverse_np(L, primary: int) -> bytes:
+    n = L.size
     if n == 0:
         return b""
-    last  = list(last_col)
-    first = sorted([(b, i) for i, b in enumerate(last)])
-
-    count_map = {}
-    occ_last  = []
-    for b in last:
-        c = count_map.get(b, 0) + 1
-        count_map[b] = c
-        occ_last.append(c)
-
-    count_map.clear()
-    occ_first = []
-    for b, _ in first:
-        c = count_map.get(b, 0) + 1
-        count_map[b] = c
-        occ_first.append(c)
-
-    pos_first = {}
-    for idx, ((b, _), k) in enumerate(zip(first, occ_first)):
-        pos_first[(b, k)] = idx
-
-    LF = [pos_first[(last[r], occ_last[r])] for r in range(n)]
-
-    res = bytearray(n)
-    r   = primary
+    # A stable argsort of the last column is the first column; its inverse
+    # permutation is exactly the LF mapping, so the dict-based occurrence
+    # tables collapse into two vector ops.
+    order = np.argsort(L, kind="stable")
+    LF = np.empty(n, dtype=np.int64)
+    LF[order] = np.arange(n)
+
+    last = L.tolist()
+    LF   = LF.tolist()
+    res  = bytearray(n)
+    r    = primary
     for i in range(n - 1, -1, -1):
         res[i] = last[r]
         r      = LF[r]
     return bytes(res)
 
+def bwt_inverse(last_col: bytes, primary: int) -> bytes:
+    return _bwt_inverse_np(np.frombuffer(last_col, dtype=np.uint8), primary)
+
+if njit is not None:
+    # alpha holds the symbol at each list position, pos the inverse map,
+    # so the O(256) list.index scan becomes a single lookup and the
+    # front-shift is a short loop LLVM can vectorize.
+    @njit(cache=True)
+    def _mtf_encode_nb(a):
+        n     = a.size
+        out   = np.empty(n, dtype=np.uint8)
+        alpha = np.empty(256, dtype=np.uint8)
+        pos   = np.empty(256, dtype=np.uint8)
+        for s in range(256):
+            alpha[s] = s
+            pos[s]   = s
+        for i in range(n):
+            b   = a[i]
+            idx = pos[b]
+            out[i] = idx
+            for k in range(idx, 0, -1):
+                s        = alpha[k - 1]
+                alpha[k] = s
+                pos[s]   = k
+            alpha[0] = b
+            pos[b]   = 0
+        return out
+
+    # MTF and RLE fused into one pass over the BWT last column: the
+    # intermediate n-byte MTF buffer is never materialized, the run
+    # accumulator lives in registers. Output format is identical to
+    # tf_rle(mtf_encode(...)).
+    @njit(cache=True)
+    def _mtf_rle_fused_nb(a):
+        n     = a.size
+        out   = np.empty(2 * n, dtype=np.uint8)
+        alpha = np.empty(256, dtype=np.uint8)
+        pos   = np.empty(256, dtype=np.uint8)
+        for s in range(256):
+            alpha[s] = s
+            pos[s]   = s
+        j    = 0
+        prev = np.uint8(0)
+        run  = 0
+        for i in range(n):
+            b   = a[i]
+            idx = pos[b]
+            for k in range(idx, 0, -1):
+                s        = alpha[k - 1]
+                alpha[k] = s
+                pos[s]   = k
+            alpha[0] = b
+            pos[b]   = 0
+            if run > 0 and idx == prev and run < 255:
+                run += 1
+            else:
+                if run > 0:
+                    out[j]     = prev
+                    out[j + 1] = run
+                    j += 2
+                prev = idx
+                run  = 1
+        if run > 0:
+            out[j]     = prev
+            out[j + 1] = run
+            j += 2
+        return out[:j]
+
+    @njit(cache=True)
+    def _mtf_rle_fused_inv_nb(a):
+        m     = (a.size // 2) * 2
+        total = 0
+        for i in range(1, m, 2):
+            total += a[i]
+        out   = np.empty(total, dtype=np.uint8)
+        alpha = np.empty(256, dtype=np.uint8)
+        for s in range(256):
+            alpha[s] = s
+        j = 0
+        for i in range(0, m, 2):
+            idx = a[i]
+            run = a[i + 1]
+            if idx == 0:
+                b = alpha[0]
+                for _ in range(run):
+                    out[j] = b
+                    j += 1
+            else:
+                # a repeated non-zero index names a different symbol each
+                # time, so the alphabet must rotate per repetition
+                for _ in range(run):
+                    b = alpha[idx]
+                    for k in range(idx, 0, -1):
+                        alpha[k] = alpha[k - 1]
+                    alpha[0] = b
+                    out[j] = b
+                    j += 1
+        return out
+
+    @njit(cache=True)
+    def _mtf_decode_nb(a):
+        n     = a.size
+        out   = np.empty(n, dtype=np.uint8)
+        alpha = np.empty(256, dtype=np.uint8)
+        for s in range(256):
+            alpha[s] = s
+        for i in range(n):
+            idx = a[i]
+            b   = alpha[idx]
+            out[i] = b
+            for k in range(idx, 0, -1):
+                alpha[k] = alpha[k - 1]
+            alpha[0] = b
+        return out
+
 def mtf_encode(data: bytes) -> bytes:
-    alphabet = list(range(256))
-    out      = []
-    for b in data:
-        idx = alphabet.index(b)
-        out.append(idx)
-        alphabet.pop(idx)
-        alphabet.insert(0, b)
+    if njit is not None:
+        return _mtf_encode_nb(np.frombuffer(data, dtype=np.uint8)).tobytes()
+    # pos is the inverse of alpha, so the O(256) list.index scan becomes
+    # one lookup and only the idx-long prefix gets shifted — on typical
+    # BWT output idx stays small, making this O(n) amortized
+    alpha = bytearray(range(256))
+    pos   = bytearray(range(256))
+    out   = bytearray(len(data))
+    for i, b in enumerate(data):
+        idx = pos[b]
+        out[i] = idx
+        if idx:
+            alpha[1:idx + 1] = alpha[:idx]
+            alpha[0] = b
+            for k in range(1, idx + 1):
+                pos[alpha[k]] = k
+            pos[b] = 0
     return bytes(out)
 
 def mtf_decode(data: bytes) -> bytes:
-    alphabet = list(range(256))
-    out      = []
-    for idx in data:
-        b = alphabet[idx]
-        out.append(b)
-        alphabet.pop(idx)
-        alphabet.insert(0, b)
+    if njit is not None:
+        return _mtf_decode_nb(np.frombuffer(data, dtype=np.uint8)).tobytes()
+    alpha = bytearray(range(256))
+    out   = bytearray(len(data))
+    for i, idx in enumerate(data):
+        b = alpha[idx]
+        out[i] = b
+        if idx:
+            alpha[1:idx + 1] = alpha[:idx]
+            alpha[0] = b
     return bytes(out)
 
+# bzip2-style blocking: caps BWT memory per worker and lets big inputs
+# spread across cores. The marker can never be a primary index, which
+# keeps old single-block payloads decodable.
+_BWT_BLOCK      = 900_000
+_BWT_BLOCK_MARK = 0xFFFFFFFF
+
+def _bwt_block_encode(block: bytes) -> bytes:
+    # stays on uint8 arrays from the SA gather through the fused
+    # MTF+RLE kernel; bytes materialize once, at the framing below
+    last_col, primary = _bwt_last_np(block)
+    if njit is not None:
+        body = _mtf_rle_fused_nb(last_col).tobytes()
+    else:
+        body = tf_rle(mtf_encode(last_col.tobytes()))
+    return struct.pack(">II", primary, len(body)) + body
+
+def _bwt_block_decode(primary: int, body: bytes) -> bytes:
+    a = np.frombuffer(body, dtype=np.uint8)
+    if njit is not None:
+        return _bwt_inverse_np(_mtf_rle_fused_inv_nb(a), primary)
+    return bwt_inverse(mtf_decode(itf_rle(body)), primary)
+
+def _own_pool_ok() -> bool:
+    # don't spawn a nested pool when already inside a worker process
+    return multiprocessing.parent_process() is None
+
 def tf_bwt_mtf_rle(data: bytes) -> bytes:
-    bwt, primary = bwt_transform(data)
-    mtf          = mtf_encode(bwt)
-    return struct.pack(">I", primary) + tf_rle(mtf)
+    blocks = [bytes(data[i:i + _BWT_BLOCK])
+              for i in range(0, len(data), _BWT_BLOCK)]
+    if len(blocks) > 1 and _own_pool_ok():
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            encoded = list(ex.map(_bwt_block_encode, blocks))
+    else:
+        encoded = [_bwt_block_encode(b) for b in blocks]
+    head = struct.pack(">III", _BWT_BLOCK_MARK, len(blocks), _BWT_BLOCK)
+    return head + b"".join(encoded)
 
 def itf_bwt_mtf_rle(payload: bytes) -> bytes:
     if len(payload) < 4:
         return b""
-    primary = struct.unpack(">I", payload[:4])[0]
-    mtf_rle = payload[4:]
-    mtf     = itf_rle(mtf_rle)
-    bwt_last = mtf_decode(mtf)
-    return bwt_inverse(bwt_last, primary)
+    first = struct.unpack(">I", bytes(payload[:4]))[0]
+    if first != _BWT_BLOCK_MARK:
+        # single-block payload from before blocking was introduced
+        return _bwt_block_decode(first, bytes(payload[4:]))
+    num_blocks = struct.unpack(">I", bytes(payload[4:8]))[0]
+    off = 12
+    primaries, bodies = [], []
+    for _ in range(num_blocks):
+        primary, blen = struct.unpack(">II", bytes(payload[off:off + 8]))
+        off += 8
+        primaries.append(primary)
+        bodies.append(bytes(payload[off:off + blen]))
+        off += blen
+    if num_blocks > 1 and _own_pool_ok():
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            decoded = list(ex.map(_bwt_block_decode, primaries, bodies))
+    else:
+        decoded = [_bwt_block_decode(p, b) for p, b in zip(primaries, bodies)]
+    return b"".join(decoded)
 
 TRANSFORMS = {
     "none":        (tf_none,        itf_none),
@@ -158,85 +397,228 @@ TRANSFORMS = {
 
 # ----------------- codecs ---------------------
 
+# pre-initialized deflate stream, copied per call: skips the ~256 KiB
+# z_stream setup on every trial, and raw wbits drop the zlib wrapper
+# that our own header and checksum make redundant
+_ZC_TEMPLATE = zlib.compressobj(9, zlib.DEFLATED, -15, 9)
+
+def _zlib_compress(b) -> bytes:
+    zc = _ZC_TEMPLATE.copy()
+    return zc.compress(b) + zc.flush()
+
+def _zlib_decompress(b) -> bytes:
+    try:
+        return zlib.decompress(b, -15)
+    except zlib.error:
+        pass
+    # archives written before the switch to raw deflate; retried outside
+    # the except block so a genuine corruption error surfaces on its own
+    # instead of chained to the raw-deflate miss
+    return zlib.decompress(b)
+
+def _next_pow2(n: int) -> int:
+    return 1 << max(0, n - 1).bit_length()
+
+def _lzma_compress(b) -> bytes:
+    # preset 9|EXTREME costs minutes on big inputs for <1% extra ratio;
+    # default to 6 and let QDSX_LZMA_PRESET restore the old behavior
+    preset = int(os.environ.get("QDSX_LZMA_PRESET", "6"))
+    if len(b) > 16 * 1024 * 1024:
+        filters = [{"id": lzma.FILTER_LZMA2, "preset": preset,
+                    "dict_size": min(1 << 27, _next_pow2(len(b)))}]
+        return lzma.compress(b, filters=filters)
+    return lzma.compress(b, preset=preset)
+
 CODECS = {
-    "zlib": (lambda b: zlib.compress(b, 9),
-             lambda b: zlib.decompress(b)),
+    "zlib": (_zlib_compress,
+             _zlib_decompress),
     "bz2":  (lambda b: bz2.compress(b, 9),
              lambda b: bz2.decompress(b)),
-    "lzma": (lambda b: lzma.compress(b, preset=9 | lzma.PRESET_EXTREME),
+    "lzma": (_lzma_compress,
              lambda b: lzma.decompress(b)),
 }
 
+if zstd is not None:
+    # the only codec here whose C library threads a single compress
+    # call across all cores by itself
+    _ZSTD_CCTX = zstd.ZstdCompressor(level=19, threads=-1)
+    CODECS["zstd"] = (lambda b: _ZSTD_CCTX.compress(b),
+                      lambda b: zstd.ZstdDecompressor().decompress(b))
+
+def _codec_decode(cname: str, cdata):
+    # "none" is the store pseudo-codec used for empty, tiny and
+    # pre-compressed inputs; it never appears in CODECS
+    if cname == "none":
+        return cdata
+    if cname not in CODECS:
+        # archives travel; the zstd codec is an optional import here
+        if cname == "zstd":
+            raise RuntimeError(
+                "Archive needs the zstd codec; install the zstandard package")
+        raise RuntimeError(f"Archive needs unknown codec '{cname}'")
+    return CODECS[cname][1](cdata)
+
 # -------------- header helpers ----------------
 
 def encode_header(header: dict) -> bytes:
-    hdr = json.dumps(header, sort_keys=True).encode("utf-8")
-    return MAGIC + struct.pack(">I", VERSION) + struct.pack(">I", len(hdr)) + hdr
-
-def parse_header(blob: bytes):
+    name = header["orig_name"].encode("utf-8")
+    return struct.pack(_HDR_FMT, MAGIC, VERSION,
+                       TRANSFORM_IDS[header["transform"]],
+                       CODEC_IDS[header["codec"]],
+                       header["orig_size"],
+                       bytes.fromhex(header["orig_sha256"]),
+                       header["timestamp"],
+                       len(name)) + name
+
+def parse_header(blob):
     if len(blob) < 12:
         raise RuntimeError("Blob too small for QDSX header")
     if blob[:4] != MAGIC:
         raise RuntimeError("Bad QDSX magic")
-    off     = 4
-    version = struct.unpack(">I", blob[off:off+4])[0]; off += 4
-    hlen    = struct.unpack(">I", blob[off:off+4])[0]; off += 4
+    version = struct.unpack(">I", blob[4:8])[0]
+    if version == 2:
+        return _parse_header_v2(blob)
+    if len(blob) < _HDR_SIZE:
+        raise RuntimeError("Blob too small for QDSX header")
+    (_, _, tid, cid, orig_size,
+     sha, ts, name_len) = struct.unpack(_HDR_FMT, blob[:_HDR_SIZE])
+    if _HDR_SIZE + name_len > len(blob):
+        raise RuntimeError("Corrupt QDSX header length")
+    header = {
+        "version":      version,
+        "orig_name":    bytes(blob[_HDR_SIZE:_HDR_SIZE + name_len]).decode("utf-8"),
+        "orig_size":    orig_size,
+        "orig_sha256":  sha.hex(),
+        "transform":    _TRANSFORM_BY_ID[tid],
+        "codec":        _CODEC_BY_ID[cid],
+        "timestamp":    ts,
+    }
+    return version, header, blob[_HDR_SIZE + name_len:]
+
+def _parse_header_v2(blob):
+    # legacy JSON headers written by VERSION 2 archives
+    off  = 8
+    hlen = struct.unpack(">I", blob[off:off+4])[0]; off += 4
     if off + hlen > len(blob):
         raise RuntimeError("Corrupt QDSX header length")
-    hdr_json = blob[off:off+hlen]
-    off     += hlen
-    header   = json.loads(hdr_json.decode("utf-8"))
-    cdata    = blob[off:]
-    return version, header, cdata
+    header = json.loads(bytes(blob[off:off+hlen]).decode("utf-8"))
+    return 2, header, blob[off+hlen:]
 
 # ---------------- pack / unpack ---------------
 
-def qdsx_pack(path: str) -> str:
-    with open(path, "rb") as f:
-        raw = f.read()
-
-    if not raw:
-        header = {
-            "version":      VERSION,
-            "orig_name":    os.path.basename(path),
-            "orig_size":    0,
-            "orig_sha256":  sha256_bytes(b""),
-            "transform":    "none",
-            "codec":        "none",
-            "timestamp":    time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-        }
-        blob    = encode_header(header)
-        outpath = path + ".qdsx"
-        with open(outpath, "wb") as f:
-            f.write(blob)
-        log(f"PACK {path} (empty) -> {outpath}")
-        return outpath
-
-    orig_sha  = sha256_bytes(raw)
-    best_size = None
-    best_key  = None
-
-    for tname, (tf, _) in TRANSFORMS.items():
+def _entropy_bits(raw) -> float:
+    # Shannon entropy of the byte histogram, in bits/byte — a cheap
+    # one-pass bound on how much any codec can still squeeze out.
+    counts = np.bincount(np.frombuffer(raw, dtype=np.uint8), minlength=256)
+    p = counts[counts > 0] / len(raw)
+    return float(-(p * np.log2(p)).sum())
+
+def _heavy_policy(raw) -> str:
+    h = _entropy_bits(raw)
+    if h > 7.8:
+        return "never"   # near-random: lzma/bz2 cannot beat zlib enough to matter
+    if h < 4.0:
+        return "always"
+    return "auto"
+
+def _trial_transform(tname: str, tdata: bytes, raw_len: int, path: str,
+                     heavy: str = "always"):
+    # Runs in a worker process: tries every codec on one transform's
+    # output (shipped once per transform) and keeps the local best.
+    best = None
+    skip_heavy = False
+    for cname, (enc, _) in CODECS.items():
+        # the heavy gate exists to dodge lzma/bz2's cost; zstd is cheap
+        # enough to always deserve its attempt
+        if skip_heavy and cname != "zstd":
+            continue
+        t0 = time.perf_counter()
         try:
-            tdata = tf(raw)
+            cdata = enc(tdata)
         except Exception as e:
-            log(f"TRANSFORM FAIL {tname} on {path}: {e}")
+            log(f"CODEC FAIL {cname} on {path} ({tname} stage): {e}")
             continue
-        for cname, (enc, _) in CODECS.items():
-            try:
-                cdata = enc(tdata)
-            except Exception as e:
-                log(f"CODEC FAIL {cname} on {path} ({tname} stage): {e}")
-                continue
-            size = len(cdata)
-            if best_size is None or size < best_size:
-                best_size = size
-                best_key  = (tname, cname, cdata)
-
-    if best_key is None:
-        raise RuntimeError("No working transform/codec combo for file")
+        size = len(cdata)
+        log(f"TRIAL {tname}+{cname} on {path}: {size} bytes "
+            f"in {time.perf_counter() - t0:.3f}s")
+        if best is None or size < best[0]:
+            best = (size, tname, cname, cdata)
+        if size > 10 * raw_len:
+            # the transform blew the data up an order of magnitude past
+            # the raw size; the heavier codecs cannot claw that back
+            log(f"SKIP remaining codecs for {tname} on {path}")
+            break
+        if cname == "zlib":
+            if heavy == "never":
+                log(f"SKIP heavy codecs for {tname} on {path}: near-random input")
+                skip_heavy = True
+            elif heavy == "auto" and size <= 0.8 * raw_len:
+                log(f"SKIP heavy codecs for {tname} on {path}: "
+                    f"zlib ratio {size / raw_len:.2f}")
+                skip_heavy = True
+    return best
+
+def qdsx_pack(path: str) -> str:
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            header = {
+                "version":      VERSION,
+                "orig_name":    os.path.basename(path),
+                "orig_size":    0,
+                "orig_sha256":  _EMPTY_SHA256,
+                "transform":    "none",
+                "codec":        "none",
+                "timestamp":    int(time.time()),
+            }
+            blob    = encode_header(header)
+            outpath = path + ".qdsx"
+            with open(outpath, "wb") as out:
+                out.write(blob)
+            log(f"PACK {path} (empty) -> {outpath}")
+            return outpath
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # transforms consume a zero-copy view of the map; pages are faulted
+    # in on demand instead of read into a second n-byte bytes object
+    with mm:
+        raw = memoryview(mm)
+        try:
+            return _pack_raw(path, raw)
+        finally:
+            raw.release()
+
+# magic prefixes of containers that are already compressed: a second
+# pass through BWT+codec search cannot win, store them as-is
+_COMPRESSED_MAGICS = (b"\x1f\x8b", b"PK", b"\xfd7zXZ\x00", b"\x28\xb5\x2f\xfd")
+
+def _scan_raw(raw):
+    # One warm pass over the map before anything else touches it: the
+    # digest streams through OpenSSL's SHA-NI path with no Python-side
+    # chunking, and the entropy histogram reads the pages while they are
+    # still hot instead of after the trial fan-out.
+    sha = hashlib.sha256(raw).hexdigest()
+    return sha, _heavy_policy(raw)
+
+def _pack_raw(path: str, raw) -> str:
+    orig_sha, heavy = _scan_raw(raw)
+    n    = len(raw)
+    sig  = bytes(raw[:6])
+
+    if sig.startswith(_COMPRESSED_MAGICS):
+        log(f"PRECOMPRESSED {path}: storing unmodified")
+        best = (n, "none", "none", bytes(raw))
+    elif n < 256:
+        # too small for the BWT machinery to earn its keep
+        cdata = CODECS["zlib"][0](bytes(raw))
+        if len(cdata) < n:
+            best = (len(cdata), "none", "zlib", cdata)
+        else:
+            best = (n, "none", "none", bytes(raw))
+    else:
+        best = _search_best(path, raw, heavy)
 
-    tname, cname, cdata = best_key
+    best_size, tname, cname, cdata = best
 
     header = {
         "version":      VERSION,
@@ -245,7 +627,7 @@ def qdsx_pack(path: str) -> str:
         "orig_sha256":  orig_sha,
         "transform":    tname,
         "codec":        cname,
-        "timestamp":    time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "timestamp":    int(time.time()),
     }
 
     blob    = encode_header(header) + cdata
@@ -254,8 +636,9 @@ def qdsx_pack(path: str) -> str:
     with open(outpath, "wb") as f:
         f.write(blob)
 
-    # self-check
-    restored = qdsx_unpack(outpath, return_bytes=True)
+    # self-check, in memory: re-reading the file and re-parsing the
+    # header would only repeat work we just did
+    restored = TRANSFORMS[tname][1](_codec_decode(cname, cdata))
     if restored != raw:
         raise RuntimeError("QDSX integrity fail on self-check")
 
@@ -263,20 +646,62 @@ def qdsx_pack(path: str) -> str:
     log(f"PACK {path} -> {outpath} using {tname}+{cname}, ratio={ratio:.3f}")
     return outpath
 
-def qdsx_unpack(qpath: str, return_bytes: bool = False):
-    with open(qpath, "rb") as f:
-        blob = f.read()
+def _search_best(path: str, raw, heavy: str):
+
+    tdata_cache = {}
+    for tname, (tf, _) in TRANSFORMS.items():
+        try:
+            tdata = tf(raw)
+        except Exception as e:
+            log(f"TRANSFORM FAIL {tname} on {path}: {e}")
+            continue
+        # workers need real bytes; only tf_none still hands back a view
+        tdata_cache[tname] = tdata if isinstance(tdata, bytes) else bytes(tdata)
+
+    best = None
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        futures = [ex.submit(_trial_transform, tname, tdata, len(raw), path,
+                             heavy)
+                   for tname, tdata in tdata_cache.items()]
+        for fut in as_completed(futures):
+            res = fut.result()
+            if res is not None and (best is None or res[0] < best[0]):
+                best = res
+
+    if best is None:
+        raise RuntimeError("No working transform/codec combo for file")
+    return best
 
+def _decode_blob(blob):
+    # blob may be bytes or a zero-copy mmap view; parse_header slices
+    # stay views all the way into the codec's decompress call
     _, header, cdata = parse_header(blob)
     tname = header.get("transform", "none")
     cname = header.get("codec", "none")
 
-    if header.get("orig_size", 0) == 0 and cname == "none":
-        raw = b""
-    else:
-        _, dec = CODECS[cname]
-        _, itf = TRANSFORMS[tname]
-        raw = itf(dec(cdata))
+    raw = TRANSFORMS[tname][1](_codec_decode(cname, cdata))
+    # the store path leaves raw as a view into the map; the caller
+    # outlives the map, so materialize it
+    return header, raw if isinstance(raw, bytes) else bytes(raw)
+
+def qdsx_unpack(qpath: str, return_bytes: bool = False):
+    with open(qpath, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            raise RuntimeError("Blob too small for QDSX header")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            try:
+                header, raw = _decode_blob(memoryview(mm))
+            except Exception as e:
+                # drop tracebacks along the whole exception chain before
+                # the map closes: their frames pin memoryview slices of
+                # mm, and mm.close() would raise BufferError over the
+                # real error
+                exc = e
+                while exc is not None:
+                    exc.__traceback__ = None
+                    exc = exc.__cause__ or exc.__context__
+                raise e from None
 
     if sha256_bytes(raw) != header["orig_sha256"]:
         raise RuntimeError("Checksum mismatch while unpacking")
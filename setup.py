@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+# Builds the optional _bwt extension (BWT fallback when pydivsufsort is
+# not installed):  python setup.py build_ext --inplace
+
+from setuptools import Extension, setup
+from Cython.Build import cythonize
+
+setup(
+    name="qdsx-engine",
+    install_requires=["numpy"],
+    ext_modules=cythonize(
+        [Extension("_bwt", ["_bwt.pyx"],
+                   extra_compile_args=["-O3", "-march=native"])],
+        language_level=3,
+    ),
+)